@@ -1,6 +1,14 @@
-from langchain.agents import initialize_agent, AgentType
-from langchain.memory import ConversationBufferMemory
-from .llm import llm
+import asyncio
+import json
+import os
+
+from langchain.agents import AgentExecutor
+from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+from langchain.agents.output_parsers.tools import ToolsAgentOutputParser
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnablePassthrough
+from .llm import llm, llm_fast
 
 # Import your tools
 from agents.tools import (
@@ -8,6 +16,8 @@ from agents.tools import (
     fetch_email_by_query,
     sort_and_move_emails,
     classify_email,
+    classify_emails,
+    summarize_emails,
     generate_todo,
     fetch_emails_by_sender
 )
@@ -18,44 +28,85 @@ tools = [
     fetch_email_by_query,
     sort_and_move_emails,
     classify_email,
+    classify_emails,
+    summarize_emails,
     generate_todo,
     fetch_emails_by_sender
 ]
 
-# Memory for chat context
-memory = ConversationBufferMemory(
+# Give every tool an async implementation: the sync tool functions are plain
+# blocking HTTPS I/O, so when the model emits several tool calls in one turn
+# the executor can fan them out to threads and run them concurrently. The
+# semaphore keeps the fan-out bounded so Gmail/Groq rate limits are respected.
+TOOL_CONCURRENCY_LIMIT = int(os.getenv("TOOL_CONCURRENCY_LIMIT", 8))
+_tool_semaphore = asyncio.Semaphore(TOOL_CONCURRENCY_LIMIT)
+
+def _bounded_async(func):
+    async def runner(*args, **kwargs):
+        async with _tool_semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+    return runner
+
+for t in tools:
+    t.coroutine = _bounded_async(t.func)
+
+# Memory for chat context. Recent turns are kept verbatim and older ones get
+# summarized, so the prompt stays bounded instead of growing with every turn
+# until it hits the context limit. The summarization itself is a background
+# compression step, so it runs on the fast 8B model.
+memory = ConversationSummaryBufferMemory(
+    llm=llm_fast,
+    max_token_limit=2000,
     memory_key="chat_history",
     return_messages=True
 )
 
-# Initialize agent with reasoning and multi-step capability
-chat_agent = initialize_agent(
+prompt = ChatPromptTemplate.from_messages([
+    ("system", "You are WaveMail, an email assistant. Use the available tools to fetch, classify, sort, and summarize the user's emails. "
+               "Pass natural language queries as tool inputs. If the query needs several independent tool calls, request them all at once so they run in parallel. "
+               "If you cannot perform the requested action, reply: I am unable to perform this action."),
+    MessagesPlaceholder("chat_history"),
+    ("user", "{input}"),
+    MessagesPlaceholder("agent_scratchpad"),
+])
+
+# Groq speaks the OpenAI tool-call schema, so the model can emit multiple tool
+# calls in a single turn and the executor runs them all in the same step -
+# instead of the old ReAct agent's strict one-tool-per-turn loop.
+llm_with_tools = llm.bind_tools(tools, parallel_tool_calls=True)
+
+agent = (
+    RunnablePassthrough.assign(
+        agent_scratchpad=lambda x: format_to_tool_messages(x["intermediate_steps"])
+    )
+    | prompt
+    | llm_with_tools
+    | ToolsAgentOutputParser()
+)
+
+chat_agent = AgentExecutor(
+    agent=agent,
     tools=tools,
-    llm=llm,
-    agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
     memory=memory,
     verbose=True,
     handle_parsing_errors=True,
     max_iterations=5, # allows the agent to call multiple tools in one query
-    return_direct=True
 )
 
 def run_chat(query: str) -> str:
     """
     Run the chatbot with reasoning using multiple tools as required. Keep chat history to send output back to the LLM for context.
     Keep the action_input as a natural language query.
-    If the answer requires multiple steps, call one tool at a time. Do not nest tool calls.
-    Do not use json or any other formatting in the input when calling the tools. VERY IMPORTANT.
     Features:
-    - Uses ReAct reasoning: Thought → Action → Observation → Next Thought
-    - Calls one tool at a time, and then the next based on observations
+    - Uses native tool calling: the LLM emits one or more tool calls per turn
+    - Independent tool calls in the same turn are executed together
     - Send output of tool to next tool if needed
     - Maintains chat history for context
     - Returns a string response
     - If the agent cannot answer, it returns: "I am unable to perform this action."
     """
     try:
-        result = chat_agent.invoke(query)
+        result = chat_agent.invoke({"input": query})
 
         # Ensure output is a string for memory storage
         if isinstance(result, dict) and "output" in result:
@@ -67,4 +118,43 @@ def run_chat(query: str) -> str:
             return str(result)
     except Exception as e:
         print("Error running chat agent:", e)
-        return "I am unable to perform this action."
\ No newline at end of file
+        return "I am unable to perform this action."
+
+async def arun_chat_stream(query: str):
+    """
+    Server-sent-events generator for /chat/stream: yields answer tokens as the
+    model produces them, so the frontend renders from the first token instead
+    of waiting for the full agent run to finish. Tool execution happens
+    between token bursts; only the model's final answer tokens are emitted.
+    """
+    try:
+        async for event in chat_agent.astream_events({"input": query}, version="v2"):
+            if event["event"] == "on_chat_model_stream":
+                content = event["data"]["chunk"].content
+                if content:
+                    yield f"data: {json.dumps(content)}\n\n"
+        yield "event: end\ndata: {}\n\n"
+    except Exception as e:
+        print("Error streaming chat agent:", e)
+        yield f"data: {json.dumps('I am unable to perform this action.')}\n\n"
+        yield "event: end\ndata: {}\n\n"
+
+async def arun_chat(query: str) -> str:
+    """
+    Async entry point for run_chat. Parallel tool calls emitted in one turn
+    are gathered concurrently (each bounded by the tool semaphore) instead of
+    executed one after another.
+    """
+    try:
+        result = await chat_agent.ainvoke({"input": query})
+
+        if isinstance(result, dict) and "output" in result:
+            output_text = result["output"]
+            if not isinstance(output_text, str):
+                output_text = str(output_text)
+            return output_text
+        else:
+            return str(result)
+    except Exception as e:
+        print("Error running chat agent:", e)
+        return "I am unable to perform this action."
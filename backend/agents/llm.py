@@ -8,3 +8,15 @@ llm = ChatGroq(
     temperature=0,
     groq_api_key=GROQ_API_KEY
 )
+
+# Smaller/faster tier for the tile pipelines - classification verdicts and
+# one-phrase summaries don't need a 70B model, and 8b-instant is roughly 10x
+# faster and cheaper on Groq. The token cap also bounds decode time: these
+# outputs are tiny structured lists, never long prose. The chat agent stays
+# on the 70B model above.
+llm_fast = ChatGroq(
+    model="llama-3.1-8b-instant",
+    temperature=0,
+    max_tokens=512,
+    groq_api_key=GROQ_API_KEY
+)
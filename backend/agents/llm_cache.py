@@ -0,0 +1,89 @@
+"""
+Semantic response cache for plain llm.invoke(prompt) calls.
+
+Exact repeats (same newsletter, same extraction prompt) are served from a
+fingerprint dict. When sentence-transformers is installed, near-duplicate
+prompts also hit via embedding cosine similarity, so re-worded user queries
+and boilerplate emails skip the Groq round trip too.
+"""
+import hashlib
+
+from .llm import llm
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = None
+    SentenceTransformer = None
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+SIMILARITY_THRESHOLD = 0.92
+
+class SemanticCache:
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, maxsize=2048):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._exact = {}      # sha256(prompt) -> response
+        self._vectors = []    # normalized embeddings, parallel to _responses
+        self._responses = []
+        self._model = None    # loaded lazily - the model is a heavy import
+
+    def _embed(self, text):
+        if SentenceTransformer is None:
+            return None
+        if self._model is None:
+            self._model = SentenceTransformer(EMBED_MODEL_NAME)
+        return self._model.encode([text], normalize_embeddings=True)[0]
+
+    def get(self, text, semantic=True):
+        key = hashlib.sha256(text.encode()).hexdigest()
+        if key in self._exact:
+            return self._exact[key]
+
+        if semantic and self._vectors:
+            vec = self._embed(text)
+            if vec is not None:
+                sims = np.asarray(self._vectors) @ vec
+                best = int(sims.argmax())
+                if sims[best] >= self.threshold:
+                    return self._responses[best]
+        return None
+
+    def put(self, text, response, semantic=True):
+        if len(self._exact) >= self.maxsize:
+            # Simple wholesale eviction - the cache refills quickly and this
+            # keeps memory bounded without LRU bookkeeping per lookup
+            self._exact.clear()
+            self._vectors, self._responses = [], []
+
+        key = hashlib.sha256(text.encode()).hexdigest()
+        self._exact[key] = response
+
+        if not semantic:
+            # Kept out of the embedding index so a merely-similar prompt can
+            # never be served this response
+            return
+
+        vec = self._embed(text)
+        if vec is not None:
+            self._vectors.append(vec)
+            self._responses.append(response)
+
+_cache = SemanticCache()
+
+def cached_invoke(prompt: str, model=None, semantic: bool = True) -> str:
+    """
+    llm.invoke with the semantic cache in front. Returns the content string.
+
+    semantic=False restricts both lookup and store to exact prompt matches.
+    Use it for prompts where a near-duplicate must NOT reuse the answer -
+    action routing and entity extraction turn on the exact wording of the
+    user's query, unlike classify/summarize/todo prompts over email bodies.
+    """
+    hit = _cache.get(prompt, semantic=semantic)
+    if hit is not None:
+        return hit
+    response = (model or llm).invoke(prompt)
+    _cache.put(prompt, response.content, semantic=semantic)
+    return response.content
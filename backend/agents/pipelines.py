@@ -1,11 +1,66 @@
-from .tools import fetch_email_by_query, classify_email, summarize_email, sort_and_move_emails, generate_todo
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def get_todolist():
-    emails = fetch_email_by_query.func("is:important")  # Get todo for all important emails
-    todolist = []
+from .tools import fetch_email_by_query, mailbox_updated, aclassify_emails_batch, asummarize_email, asummarize_email_stream, rule_based_check, sort_and_move_emails, generate_todo
 
-    for email in emails:
-        todo = generate_todo.func(email)
+# Thread count for the sync tool paths that can't go async (the @tool .func
+# calls are blocking HTTPS I/O, so threads give real parallelism here)
+TOOL_CONCURRENCY_LIMIT = int(os.getenv("TOOL_CONCURRENCY_LIMIT", 8))
+
+# Dashboard polls hit /notifications and /todolist every few seconds; within
+# this window the Gmail + LLM passes would recompute the identical view, so
+# the finished result is memoized briefly per (pipeline, query, n).
+RESULT_TTL_SECONDS = int(os.getenv("RESULT_TTL_SECONDS", 30))
+_result_cache: dict = {}
+
+def _cached_result(key):
+    hit = _result_cache.get(key)
+    if hit is not None and time.monotonic() - hit[0] < RESULT_TTL_SECONDS:
+        return hit[1]
+    return None
+
+def _store_result(key, value):
+    _result_cache[key] = (time.monotonic(), value)
+    return value
+
+def _todo_for_email(email):
+    try:
+        return generate_todo.func(email)
+    except Exception as e:
+        # Error sentinel: one failed email shouldn't break the whole batch
+        print(f"Todo generation failed for '{email.get('subject', '')}':", e)
+        return []
+
+def get_todolist(query: str = "is:important", n: int | None = None):
+    # Single parameterized implementation: callers pick the Gmail query and an
+    # optional cap instead of keeping near-identical pipeline copies around.
+    key = ("todolist", query, n)
+    cached = _cached_result(key)
+    if cached is not None:
+        return cached
+
+    # Past the TTL, ask the History API whether the mailbox changed at all;
+    # if it didn't, the previous result is still the current full view and
+    # the Gmail + LLM recompute is skipped. Each pipeline/query pair has its
+    # own cursor, so this check can't swallow another poller's delta.
+    stale = _result_cache.get(key)
+    changed = mailbox_updated(f"todolist|{query}|{n}")
+    if stale is not None and not changed:
+        return _store_result(key, stale[1])
+
+    emails = fetch_email_by_query.func(query)
+    if n is not None:
+        emails = emails[:n]
+
+    # Generate todos for all emails in parallel threads
+    with ThreadPoolExecutor(max_workers=TOOL_CONCURRENCY_LIMIT) as executor:
+        todos = list(executor.map(_todo_for_email, emails))
+
+    todolist = []
+    for email, todo in zip(emails, todos):
         if todo == []:
             continue
         todolist.append({
@@ -14,24 +69,89 @@ def get_todolist():
             "todo": " ".join(todo) if isinstance(todo, list) else todo,  # ensure string
             "date": email["date"]
         })
-    return todolist
+    return _store_result(key, todolist)
+
+async def afilter_important(emails):
+    # Cheap rule-based pass first; only the residual goes to the LLM, classified
+    # in one batched call per 20 emails.
+    important_flags = [True] * len(emails)
+    residual = [
+        (i, email) for i, email in enumerate(emails)
+        if not rule_based_check(email.get("subject", ""), email.get("snippet", ""), email.get("from", ""))
+    ]
 
-def get_notifications():
-    emails = fetch_email_by_query.func("is:important")  # Get notification for important emails
-    notifications = []
+    labels = await aclassify_emails_batch([email for _, email in residual])
+    for (i, _), label in zip(residual, labels):
+        important_flags[i] = (label == "important")
 
+    return [email for email, flag in zip(emails, important_flags) if flag]
+
+async def aget_notifications(emails):
+    important = await afilter_important(emails)
+    # Summaries run concurrently - the Groq calls are pure I/O
+    summaries = await asyncio.gather(*(asummarize_email(email) for email in important))
+
+    return [
+        {
+            "from": email["from"],
+            "subject": email["subject"],
+            "summary": summary,
+            "date": email["date"]
+        }
+        for email, summary in zip(important, summaries)
+    ]
+
+def get_notifications(query: str = "is:important", n: int | None = None):
+    key = ("notifications", query, n)
+    cached = _cached_result(key)
+    if cached is not None:
+        return cached
+
+    # Same change-detection shortcut as get_todolist: an unchanged mailbox
+    # means the previous full view is still correct past the TTL.
+    stale = _result_cache.get(key)
+    changed = mailbox_updated(f"notifications|{query}|{n}")
+    if stale is not None and not changed:
+        return _store_result(key, stale[1])
+
+    emails = fetch_email_by_query.func(query)
+    if n is not None:
+        emails = emails[:n]
+    return _store_result(key, asyncio.run(aget_notifications(emails)))
+
+def _fetch_with_bodies(query):
+    # Blocking Gmail round trips plus the lazy body decodes, bundled so the
+    # streaming endpoint can push all of it to a worker thread in one hop
+    emails = fetch_email_by_query.func(query)
     for email in emails:
-        importance = classify_email.func(email)
-        if importance == "important":
-            summary = summarize_email(email)
-            notifications.append({
-                "from": email["from"],
-                "subject": email["subject"],
-                "summary": summary,
-                "date": email["date"]
-            })
-    return notifications
+        email.get("snippet")
+    return emails
+
+async def astream_notifications():
+    """
+    Server-sent-events generator for /notifications/stream: emits an 'email'
+    event per important email, then its summary token by token as Groq
+    generates it, so the frontend can render before generation ends.
+    """
+    # The fetch (and the body decoding the rule pass would otherwise trigger
+    # in-loop) runs in a worker thread - this generator's whole point is
+    # keeping the event loop free while the stream is produced
+    emails = await asyncio.to_thread(_fetch_with_bodies, "is:important")
+    important = await afilter_important(emails)
+
+    for email in important:
+        meta = {"from": email["from"], "subject": email["subject"], "date": email["date"]}
+        yield f"event: email\ndata: {json.dumps(meta)}\n\n"
+        async for token in asummarize_email_stream(email):
+            yield f"event: summary\ndata: {json.dumps(token)}\n\n"
+        yield "event: end\ndata: {}\n\n"
 
 def sort():
     print("Sorting emails...")
-    return sort_and_move_emails.func()
\ No newline at end of file
+    return sort_and_move_emails.func()
+
+async def asort():
+    # The Gmail client is blocking, so run the whole sort in a worker thread;
+    # the event loop stays free to serve other requests while it runs.
+    print("Sorting emails...")
+    return await asyncio.to_thread(sort_and_move_emails.func)
\ No newline at end of file
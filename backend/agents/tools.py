@@ -1,199 +1,277 @@
 from langchain.tools import tool
 from services.gmail_service import get_gmail_service
-from .llm import llm
+from .llm import llm, llm_fast
+from .llm_cache import cached_invoke
+from ._email_utils import (
+    email_fingerprint,
+    extract_headers,
+    get_body_from_google_api_payload,
+    html_to_text,
+    LazyEmail,
+)
 from langchain_core.prompts import ChatPromptTemplate
-import base64
-from bs4 import BeautifulSoup 
+from langchain_core.output_parsers import JsonOutputParser
+from config import SENDER_ALLOWLIST_PATH, GMAIL_STATE_PATH
+from googleapiclient.errors import HttpError
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import json
 from typing import List, Dict
 import re
 
+LLM_CONCURRENCY = 10 # cap concurrent Groq calls to respect rate limits
+
+# asyncio primitives bind to the event loop they first block on, and these
+# helpers run on several loops: get_notifications spins up a fresh loop per
+# poll via asyncio.run while the streaming endpoints use FastAPI's loop. A
+# single module-level Semaphore would raise "bound to a different event loop"
+# on the second contended poll, so each loop gets its own instance instead.
+_llm_semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _llm_semaphores.get(loop)
+    if sem is None:
+        sem = asyncio.Semaphore(LLM_CONCURRENCY)
+        _llm_semaphores[loop] = sem
+    return sem
+
+# Cache LLM verdicts and summaries keyed on a fingerprint of the email text.
+# The same newsletter arriving again, or repeated polls of /notifications and
+# /todolist over the same inbox, then skip the Groq call entirely.
+_LLM_CACHE_MAX = 2048
+_classify_cache: Dict[str, bool] = {}
+_summary_cache: Dict[str, str] = {}
+
+def _cache_put(cache: dict, key, value):
+    # Same bound + wholesale eviction as _body_cache and SemanticCache: the
+    # caches refill quickly and this keeps memory capped without per-lookup
+    # LRU bookkeeping.
+    if len(cache) >= _LLM_CACHE_MAX:
+        cache.clear()
+    cache[key] = value
+
 # The official Google API library might not return a standard email.message.Message object.
-# The following function is tailored for the raw dictionary structure from the API.
+# The parsing helpers tailored for its raw dictionary structure (body decoding,
+# HTML stripping, LazyEmail) live in _email_utils.
 
 #----------FETCH EMAILS AND PARSE BODY------------------------------------------------------
 
-def get_body_from_google_api_payload(payload):
-    """
-    Parses the Google API 'payload' dictionary to find the email body.
-    Prioritizes 'text/plain', falls back to 'text/html' and strips its tags.
-    This is to avoid getting html content with images and other unwanted elements.
-    """
-    text_plain = None
-    text_html = None
-
-    def find_parts(parts):
-        nonlocal text_plain, text_html
-        for part in parts:
-            if part.get('mimeType') == 'text/plain' and 'data' in part['body']:
-                text_plain = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                # If we find plain text, we can often stop, as it's preferred
-                return
-            elif part.get('mimeType') == 'text/html' and 'data' in part['body']:
-                text_html = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-            
-            # Recursive call for nested parts
-            if 'parts' in part:
-                find_parts(part['parts'])
-
-    # Start the search
-    if 'parts' in payload:
-        find_parts(payload['parts'])
-    elif 'data' in payload['body']:
-        if payload.get('mimeType') == 'text/plain':
-            text_plain = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-        elif payload.get('mimeType') == 'text/html':
-            text_html = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-
-    # --- Prioritize and Clean ---
-    if text_plain:
-        return text_plain
-    elif text_html:
-        # We only have HTML, so we need to clean it
-        soup = BeautifulSoup(text_html, "html.parser")
-        # You can remove specific tags like this:
-        for img in soup.find_all('img'):
-            img.decompose() # Remove the <img> tag completely
-        for script in soup.find_all('script'):
-            script.decompose() # Remove <script> tags
-        for style in soup.find_all('style'):
-            style.decompose() # Remove <style> tags
-            
-        # Get the text, which is now free of images and other unwanted tags
-        return soup.get_text(separator='\n', strip=True)
-        
-    return "No readable body found."
-
 # --- Fetch Emails Tool ------
+
+BATCH_SIZE = 100 # Gmail allows at most 100 calls per batch request
+
+# Prune the message.get response to just what we actually parse - headers plus
+# the body data of the (possibly nested) text parts. Attachments and the rest
+# of the MIME tree never come over the wire, which also saves Gmail quota.
+MESSAGE_FIELDS = (
+    "id,snippet,payload(mimeType,headers,body/data,"
+    "parts(mimeType,body/data,parts(mimeType,body/data,parts(mimeType,body/data))))"
+)
+
+# Even lighter variant for callers that never read the full body: Gmail sends
+# back just the three headers we use plus its own ~200-char snippet, skipping
+# all server-side MIME assembly and most of the payload bytes.
+METADATA_HEADERS = ["Subject", "From", "Date"]
+METADATA_FIELDS = "id,snippet,payload/headers"
+
+FETCH_THREAD_LIMIT = 10 # fallback fan-out when the transport can't batch
+
+def _message_get_request(service, msg_id, metadata_only):
+    if metadata_only:
+        return service.users().messages().get(
+            userId="me", id=msg_id, format="metadata",
+            metadataHeaders=METADATA_HEADERS, fields=METADATA_FIELDS
+        )
+    return service.users().messages().get(userId="me", id=msg_id, fields=MESSAGE_FIELDS)
+
+def fetch_messages_batched(service, messages, metadata_only=False):
+    """
+    Fetch the full message data for a list of message refs using Gmail's batch
+    HTTP endpoint - one round trip per 100 messages instead of one per message.
+    Transports without batch support fall back to concurrent per-message gets,
+    which still collapses the latency from N round trips to roughly one.
+    With metadata_only=True only headers + Gmail's snippet come over the wire.
+    Returns the message dicts in the same order as the input list.
+    """
+    fetched = {}
+
+    if not hasattr(service, "new_batch_http_request"):
+        def get_one(msg):
+            # Each pool thread asks for its own client - get_gmail_service is
+            # per-thread, and httplib2 transports must not be shared across
+            # threads - rather than reusing the caller's service object.
+            try:
+                return msg["id"], _message_get_request(get_gmail_service(), msg["id"], metadata_only).execute()
+            except HttpError as e:
+                print(f"Failed to fetch message {msg['id']}: {e}")
+                return msg["id"], None
+        with ThreadPoolExecutor(max_workers=min(FETCH_THREAD_LIMIT, max(len(messages), 1))) as pool:
+            for msg_id, response in pool.map(get_one, messages):
+                if response is not None:
+                    fetched[msg_id] = response
+        return [fetched[msg["id"]] for msg in messages if msg["id"] in fetched]
+
+    def collect(request_id, response, exception):
+        if exception is not None:
+            print(f"Failed to fetch message {request_id}: {exception}")
+            return
+        fetched[request_id] = response
+
+    for i in range(0, len(messages), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=collect)
+        for msg in messages[i:i + BATCH_SIZE]:
+            batch.add(_message_get_request(service, msg["id"], metadata_only), request_id=msg["id"])
+        batch.execute()
+
+    return [fetched[msg["id"]] for msg in messages if msg["id"] in fetched]
+
+def _list_message_pages(service, query=None):
+    """Yield successive pages of message refs from messages().list."""
+    page_token = None
+    while True:
+        kwargs = {"userId": "me", "pageToken": page_token}
+        if query:
+            kwargs["q"] = query
+        results = service.users().messages().list(**kwargs).execute()
+        yield results.get("messages", [])
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return
+
 @tool("fetch_emails_by_number")
-def fetch_emails_by_number(n: int = -1) -> list:
+def fetch_emails_by_number(n: int = -1, detail: str = "snippet") -> list:
     """
     Fetch the last n emails with subject, sender, date, and body.
     - If n > 0, only fetch the last n emails.
     - If n <= 0 or omitted, fetch all emails.
+    - detail: "snippet" (default) returns Gmail's ~200-char preview, which is
+      enough for classification and summaries; pass "full" only when the
+      complete body text is needed.
     """
     service = get_gmail_service()
 
     n = int(n) #chat api may pass action input as string
+    metadata_only = (detail != "full")
 
     if n <= 0: # Fetch all emails (ie n is not mentioned)
-        results = service.users().messages().list(userId="me").execute()
+        # Pipeline the two stages: while one page's messages are fetched in a
+        # worker thread, the next page's list() call is already in flight, so
+        # large inboxes don't pay list-then-fetch serially per page. This also
+        # follows nextPageToken - the single list() call stopped at page one.
+        def fetch_page(page):
+            # The worker overlaps with this thread's next list() call, so it
+            # uses its own per-thread client instead of sharing this one -
+            # httplib2 transports are not thread-safe.
+            return fetch_messages_batched(get_gmail_service(), page, metadata_only)
+
+        msg_datas = []
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = None
+            for page in _list_message_pages(service):
+                if pending is not None:
+                    msg_datas.extend(pending.result())
+                pending = pool.submit(fetch_page, page)
+            if pending is not None:
+                msg_datas.extend(pending.result())
     else:
         results = service.users().messages().list(userId="me", maxResults=n).execute()
-    messages = results.get("messages", [])
-
-    emails = []
-    for msg in messages:
-        msg_data = service.users().messages().get(userId="me", id=msg["id"]).execute()
-        headers = msg_data["payload"]["headers"]
+        msg_datas = fetch_messages_batched(service, results.get("messages", []), metadata_only)
 
-        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "(No Subject)")
-        sender = next((h["value"] for h in headers if h["name"] == "From"), "(Unknown Sender)")
-        date = next((h["value"] for h in headers if h["name"] == "Date"), "(Unknown Date)")
-        #snippet = msg_data.get("snippet", "") -- instead of snippet, we'll get the entire body
-        body = get_body_from_google_api_payload(msg_data['payload'])
-        if len(body) > 500:
-            body = body[:1000] + "..."  #Truncate long bodies for efficiency (usually spam bodies are unusually long)
+    # Body decoding is deferred until something actually reads 'snippet'
+    return [LazyEmail(msg_data) for msg_data in msg_datas]
 
-        emails.append({"id": msg["id"], "subject": subject, "from": sender, "date": date, "snippet": body})
-    return emails
-
-@tool("fetch_emails_by_sender")
-def fetch_emails_by_sender(user_query: str) -> list:
-    """CALL THIS TOOL ONLY IF YOU HAVE TO FETCH emails from a specific sender mentioned in the user query, which can then be used by other tools.
+def extract_query_params(user_query: str) -> dict:
+    """
+    Extract sender, email count, and Gmail search query from a user query in a
+    single structured LLM call, instead of one extraction prompt per field.
     """
-    # 1: Extract sender from the user query using LLM ---
     prompt = f"""
-    You are an assistant that extracts the sender from a user query about emails.
-    Return only the sender's name or email, nothing else.
+    You are an assistant that extracts email search parameters from a user query about emails.
+    Respond ONLY with a JSON object of the form:
+    {{"sender": "<sender name or email, or null>", "n": <number of emails to fetch, 1 if 'latest' or 'recent' mentioned, null if not mentioned>, "gmail_query": "<Gmail search query>"}}
+
+    For gmail_query, refer to the Gmail search operators:
+    Unread email: "is:unread"
+    Emails with attachments: "has:attachment"
+    Emails in Spam folder: "in:spam"
+    Emails in Trash folder: "in:trash"
+    Emails with high importance: "is:important"
+    Emails received after a specific date: "after:YYYY/MM/DD"
+    Emails received before a specific date: "before:YYYY/MM/DD"
+    Emails in the last 24 hours: "newer_than:1d"
+    Emails from a specific sender: "from:name or email"
+    Emails to a specific recipient: "to:name or email"
+    Emails with specific words in the subject: "subject:your words"
+    Emails with specific words in the body: "your words"
+    combination queries example: "is:unread from:jane.doe@example.com"
+    if it says "to:trash" or "to:spam" or "delete" or "move to trash" or "move to spam", fetch emails from inbox - "in:inbox"
+    If it says "sender": "The New York Times", "destination": "trash", fetch emails from inbox - 'in:inbox from:"The New York Times"'
+
+    If no search query can be extracted, use "in:inbox is:unread".
 
     User query: "{user_query}"
     """
-    response = llm.invoke(prompt)
-    sender_extracted = response.content.strip()
+    try:
+        # Exact-match caching only: "emails from Jane" and "emails from John"
+        # embed close together, and a semantic hit here would return the wrong
+        # sender/query extraction
+        params = json.loads(cached_invoke(prompt, model=llm.bind(response_format={"type": "json_object"}), semantic=False))
+    except ValueError:
+        params = {}
+    return {
+        "sender": params.get("sender") or None,
+        "n": params.get("n") if isinstance(params.get("n"), int) else None,
+        "gmail_query": params.get("gmail_query") or "in:inbox is:unread",
+    }
+
+@tool("fetch_emails_by_sender")
+def fetch_emails_by_sender(user_query: str, detail: str = "snippet") -> list:
+    """CALL THIS TOOL ONLY IF YOU HAVE TO FETCH emails from a specific sender mentioned in the user query, which can then be used by other tools.
+    detail: "snippet" (default) returns Gmail's preview; pass "full" for complete bodies.
+    """
+    # 1: Extract sender and count from the user query in one LLM call ---
+    params = extract_query_params(user_query)
+    sender_extracted = params["sender"] or ""
 
     #2: check if sender is found in any email
     service = get_gmail_service()
 
     search_query = f'from:"{sender_extracted}"'
-    
+
     print(f"Searching for emails from '{sender_extracted}'...")
 
     results = service.users().messages().list(
         userId='me',
         q=search_query
     ).execute()
-    
+
     messages = results.get('messages', [])
 
     if not messages:
         print(f"No emails found from '{sender_extracted}'.")
         return []
 
-    #3: Extract no of responses required from the user query using LLM ---
-    prompt = f"""
-    You are an assistant that extracts the number of emails to fetch from a user query about emails.
-    If 'latest' or 'recent' mentioned, return 1.
-    Return only the integer number, nothing else.
-
-    User query: "{user_query}"
-    """
-    response = llm.invoke(prompt)
-    number_extracted = response.content.strip()
-
-    n = int(number_extracted) if number_extracted.isdigit() else 1
-
-    #4: Fetch emails from the sender
-    emails = []
-    for msg in messages:
-        msg_data = service.users().messages().get(userId="me", id=msg["id"]).execute()
-        headers = msg_data["payload"]["headers"]
-
-        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "(No Subject)")
-        sender = next((h["value"] for h in headers if h["name"] == "From"), "(Unknown Sender)")
-        date = next((h["value"] for h in headers if h["name"] == "Date"), "(Unknown Date)")
-        #snippet = msg_data.get("snippet", "") -- instead of snippet, we'll get the entire body
-        body = get_body_from_google_api_payload(msg_data['payload'])
-        if len(body) > 500:
-            body = body[:1000] + "..."  #Truncate long bodies for efficiency (usually spam bodies are unusually long)
+    n = params["n"] if params["n"] and params["n"] > 0 else 1
 
-        emails.append({"id": msg["id"], "subject": subject, "from": sender, "date": date, "snippet": body})
-
-        if len(emails) >= n:
-            break
-    return emails
+    #3: Fetch emails from the sender in one batched round trip (bodies decode lazily)
+    return [
+        LazyEmail(msg_data)
+        for msg_data in fetch_messages_batched(service, messages[:n], metadata_only=(detail != "full"))
+    ]
 
 #-------------Custom email fetch tool based on user query---------
 @tool("fetch_email_by_query")
-def fetch_email_by_query(user_query: str) -> list:
-    """Fetches emails in a custom manner based on a user query, which can then be used by other tools. """
-
-    # 1: Extract search query from the user query using LLM ---
-    prompt = f"""
-    You are an assistant that extracts the search query from a user query about emails.
-    Return only the search query, nothing else.
-    refer to the Gmail search operators:
-    Unread email: "is:unread"
-    Emails with attachments: "has:attachment"
-    Emails in Spam folder: "in:spam"
-    Emails in Trash folder: "in:trash"
-    Emails with high importance: "is:important"
-    Emails received after a specific date: "after:YYYY/MM/DD"
-    Emails received before a specific date: "before:YYYY/MM/DD"
-    Emails in the last 24 hours: "newer_than:1d"
-    Emails from a specific sender: "from:name or email"
-    Emails to a specific recipient: "to:name or email"
-    Emails with specific words in the subject: "subject:your words"
-    Emails with specific words in the body: "your words"
-    combination queries example: "is:unread from:jane.doe@example.com"
-    if it says "to:trash" or "to:spam" or "delete" or "move to trash" or "move to spam", fetch emails from inbox - "in:inbox"
-    If it says "sender": "The New York Times", "destination": "trash", fetch emails from inbox - 'in:inbox from:"The New York Times"'
-
-    If no search query can be extracted, return "in:inbox is:unread".
-
-    User query: "{user_query}"
+def fetch_email_by_query(user_query: str, detail: str = "snippet") -> list:
+    """Fetches emails in a custom manner based on a user query, which can then be used by other tools.
+    detail: "snippet" (default) returns Gmail's preview; pass "full" for complete bodies.
     """
-    response = llm.invoke(prompt)
-    search_query_extracted = response.content.strip()
+
+    # 1: Extract search query from the user query (shared structured extraction) ---
+    search_query_extracted = extract_query_params(user_query)["gmail_query"]
 
     if search_query_extracted.lower() == "None":
         print("No valid custom search result obtained.")
@@ -215,55 +293,165 @@ def fetch_email_by_query(user_query: str) -> list:
         print(f"No emails found matching '{search_query_extracted}'.")
         return []
     
-    #4: Fetch emails from the search query
-    emails = []
-    for msg in messages:
-        msg_data = service.users().messages().get(userId="me", id=msg["id"]).execute()
-        headers = msg_data["payload"]["headers"]
-
-        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "(No Subject)")
-        sender = next((h["value"] for h in headers if h["name"] == "From"), "(Unknown Sender)")
-        date = next((h["value"] for h in headers if h["name"] == "Date"), "(Unknown Date)")
-        #snippet = msg_data.get("snippet", "") -- instead of snippet, we'll get the entire body
-        body = get_body_from_google_api_payload(msg_data['payload'])
-        if len(body) > 500:
-            body = body[:1500] + "..."  #Truncate long bodies for efficiency (usually spam bodies are unusually long)
-
-        emails.append({"id": msg["id"], "subject": subject, "from": sender, "date": date, "snippet": body})
-
-    return emails
+    #4: Fetch emails from the search query in one batched round trip (bodies decode lazily)
+    return [
+        LazyEmail(msg_data, truncate_at=1500)
+        for msg_data in fetch_messages_batched(service, messages, metadata_only=(detail != "full"))
+    ]
 
     
     
+#-------------Change detection for polling callers (History API)---------
+
+# The polling pipelines always serve the FULL view for their query - the
+# frontend wipes and re-renders its tiles from each response, so returning
+# only a delta would blank them out. The History API is used purely as a
+# cheap "did anything change?" probe: each pipeline keeps its own named
+# cursor in the state file, so one pipeline's check never consumes a delta
+# another pipeline still needs, and the file itself is lock-guarded because
+# /dashboard runs both pipelines concurrently.
+_history_lock = threading.Lock()
+
+def _load_history_cursors() -> dict:
+    try:
+        with open(GMAIL_STATE_PATH) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+def _save_history_cursor(cursor: str, history_id) -> None:
+    state = _load_history_cursors()
+    state[cursor] = str(history_id)
+    with open(GMAIL_STATE_PATH, "w") as f:
+        json.dump(state, f)
+
+def mailbox_updated(cursor: str) -> bool:
+    """
+    True when the mailbox changed since this cursor's last call - messages
+    added or deleted, or labels changed (which is how archiving and marking
+    important show up) - or whenever that can't be determined, so callers
+    recompute rather than serve a stale view. The first call for a cursor
+    just records the current baseline and reports True; an expired history
+    id (Gmail answers 404) resets the baseline the same way.
+    """
+    service = get_gmail_service()
+    with _history_lock:
+        last_id = _load_history_cursors().get(cursor)
+        if last_id is None:
+            profile = service.users().getProfile(userId="me", fields="historyId").execute()
+            _save_history_cursor(cursor, profile["historyId"])
+            return True
+
+        try:
+            changed = False
+            newest_id = last_id
+            page_token = None
+            while True:
+                kwargs = {
+                    "userId": "me", "startHistoryId": last_id,
+                    # Deletes and label changes alter the views too: archiving
+                    # or un-starring an email changes what is:important returns
+                    "historyTypes": ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
+                }
+                if page_token:
+                    kwargs["pageToken"] = page_token
+                history = service.users().history().list(**kwargs).execute()
+                if history.get("history"):
+                    changed = True
+                newest_id = history.get("historyId", newest_id)
+                page_token = history.get("nextPageToken")
+                if not page_token:
+                    break
+            _save_history_cursor(cursor, newest_id)
+            return changed
+        except HttpError:
+            # Stored history id expired - reset the baseline
+            profile = service.users().getProfile(userId="me", fields="historyId").execute()
+            _save_history_cursor(cursor, profile["historyId"])
+            return True
+
 # -------------------------------------------------------------------------------------------
 # --- Classify Email Tool -------------------------------------------------------------------
 
+# Prompt chains are built once at import: re-parsing the templates and
+# re-composing the Runnable pipeline on every call is pure overhead in the
+# per-email hot loop.
+# JSON mode constrains the decode to the schema, so "Yes.", "YES", or a
+# trailing explanation can no longer be misread as "not important", and the
+# response stays a handful of tokens.
+_CLASSIFY_CHAIN = ChatPromptTemplate.from_messages([
+    ("system", "You are an assistant that classifies emails as 'important' or 'not important'. Emails from work, company, HR, such as event updates, results, etc. are important. News  / newsletters / marketting emails are not important. Respond ONLY with JSON of the form {{\"important\": true}} or {{\"important\": false}}."),
+    ("user", "Email: {email}")
+]) | llm_fast.bind(response_format={"type": "json_object"}) | JsonOutputParser()
+
+_BATCH_CLASSIFY_CHAIN = ChatPromptTemplate.from_messages([
+    ("system", "You are an assistant that classifies emails as 'important' or 'not important'. Emails from work, company, HR, such as event updates, results, etc. are important. News  / newsletters / marketting emails are not important. Respond ONLY with a JSON array of strings, one per email in order, each either \"important\" or \"not important\"."),
+    ("user", "Classify each of the following {count} emails:\n\n{emails}")
+]) | llm_fast | JsonOutputParser()
+
+_SUMMARIZE_CHAIN = ChatPromptTemplate.from_messages([
+    ("system", "You are an assistant that summarizes emails in a single concise phrase."),
+    ("user", "Summarize this email. Do not mention names or additional context:\n\n{email}")
+]) | llm_fast
+
+_BATCH_SUMMARIZE_CHAIN = ChatPromptTemplate.from_messages([
+    ("system", "You are an assistant that summarizes emails. For each email produce a single concise phrase with no names or additional context. Respond ONLY with a JSON array of summary strings, one per email in order."),
+    ("user", "Summarize each of the following {count} emails:\n\n{emails}")
+]) | llm_fast | JsonOutputParser()
+
 IMPORTANT_KEYWORDS = ["urgent", "asap", "deadline", "immediately", "launch", "quarterly", "meeting", "project", "update", "report", "invoice", "payment", "schedule", "appointment", "reminder", "action required", "follow up", "important", "priority", "quarter"]
 
+# Compile the keyword list into one regex alternation at import time: a single
+# C-level scan of the text instead of one substring search per keyword. Word
+# boundaries keep e.g. "update" from matching inside "updates-digest.com".
+_IMPORTANT_KW_RE = re.compile(r"\b(?:" + "|".join(re.escape(kw) for kw in IMPORTANT_KEYWORDS) + r")\b", re.IGNORECASE)
+
+# Senders that are always important, loaded once at import from a JSON list
+# (path configurable via SENDER_ALLOWLIST_PATH) so colleagues can be added
+# without touching code. Falls back to the original hardcoded pair.
+try:
+    with open(SENDER_ALLOWLIST_PATH) as f:
+        SENDER_ALLOWLIST = frozenset(s.lower() for s in json.load(f))
+except (OSError, ValueError):
+    SENDER_ALLOWLIST = frozenset({"boss@", "teamlead@"})
+
+# Skip the LLM fallback only for degenerate bodies (read receipts, bare
+# calendar stubs). Default fetches are metadata-only, so 'snippet' is Gmail's
+# ~200-char preview - the threshold has to sit well below that or the
+# fallback becomes unreachable and every rule-miss email is written off as
+# not important.
+MIN_BODY_FOR_LLM = 40
+
+@functools.lru_cache(maxsize=2048)
 def rule_based_check(subject: str, snippet: str, sender: str) -> bool:
-    """Simple keyword and sender-based rules for importance."""
-    text = f"{subject.lower()} {snippet.lower()}"
-    if any(kw in text for kw in IMPORTANT_KEYWORDS):
+    """Simple keyword and sender-based rules for importance. Pure, so memoized.
+
+    Checks are ordered cheapest-first: the sender allowlist is a handful of
+    substring probes, the subject is a few dozen characters, and only then is
+    the (possibly decoded-on-demand) snippet scanned.
+    """
+    sender_lower = sender.lower()
+    if any(allowed in sender_lower for allowed in SENDER_ALLOWLIST):
+        return True
+    if _IMPORTANT_KW_RE.search(subject):
         print(f"Rule-based: Found important keyword. - {subject}")
         return True
-    if "boss@" in sender.lower() or "teamlead@" in sender.lower():
+    if snippet and _IMPORTANT_KW_RE.search(snippet):
+        print(f"Rule-based: Found important keyword. - {subject}")
         return True
     return False
 
 def llm_fallback_check(email_text: str) -> bool:
     """Use Groq LLM to classify importance if rule-based is inconclusive."""
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are an assistant that classifies emails as 'important' or 'not important'. Emails from work, company, HR, such as event updates, results, etc. are important. News  / newsletters / marketting emails are not important."),
-        ("user", "Email: {email}\n\nAnswer with only one word: reply Yes if important, or reply No if Not Important.")
-    ])
-    chain = prompt | llm
-    response = chain.invoke({"email": email_text})
-    decision = response.content.strip().lower()
-    if decision == "yes":
-        print("LLM-based: Classified as important.\n")
-        return True
-    print("LLM-based: Classified as not important.\n")
-    return False
+    key = email_fingerprint(email_text)
+    if key in _classify_cache:
+        return _classify_cache[key]
+    result = _CLASSIFY_CHAIN.invoke({"email": email_text})
+    decision = bool(isinstance(result, dict) and result.get("important"))
+    print(f"LLM-based: Classified as {'important' if decision else 'not important'}.\n")
+    _cache_put(_classify_cache, key, decision)
+    return decision
 
 @tool("classify_email", return_direct=False)
 def classify_email(email: dict) -> str:
@@ -274,11 +462,26 @@ def classify_email(email: dict) -> str:
     Receives an email dict from one of the fetch emails tools.
     """
     subject = email.get("subject", "")
-    snippet = email.get("snippet", "")
     sender = email.get("from", "")
 
+    # Subject + sender rules first: on a hit we never decode the body at all
+    if rule_based_check(subject, "", sender):
+        return "important"
+
+    # Obvious spam is definitively unimportant - never worth a Groq call,
+    # and a subject hit decides before the body is decoded
+    if _SPAM_KW_RE.search(subject):
+        print(f"Spam keywords in subject, not important - {subject}")
+        return f"not important - {subject}"
+
+    snippet = email.get("snippet", "") # lazy bodies decode here
+    if is_spam(email):
+        return f"not important - {subject}"
     if rule_based_check(subject, snippet, sender):
         return "important"
+    elif len(snippet) < MIN_BODY_FOR_LLM:
+        # Rules missed and the body is too short for the LLM to add signal
+        return f"not important - {subject}"
     elif llm_fallback_check(f"Subject: {subject}\nContent: {snippet}"):
         return "important"
     else:
@@ -295,36 +498,173 @@ def summarize_email(email: dict) -> str:
     snippet = email.get("snippet", "")
     text = f"Subject: {subject}\nContent: {snippet}"
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are an assistant that summarizes emails in a single concise phrase."),
-        ("user", "Summarize this email. Do not mention names or additional context:\n\n{email}")
-    ])
-    chain = prompt | llm
-    response = chain.invoke({"email": text})
-    return response.content.strip()
+    key = email_fingerprint(text)
+    if key in _summary_cache:
+        return _summary_cache[key]
+
+    response = _SUMMARIZE_CHAIN.invoke({"email": text})
+    summary = response.content.strip()
+    _cache_put(_summary_cache, key, summary)
+    return summary
+
+BATCH_CLASSIFY_SIZE = 20 # emails per LLM call, keeps the prompt well under context limits
+
+async def aclassify_emails_batch(emails: List[dict]) -> List[str]:
+    """
+    Classify several emails with one LLM call per batch of 20 instead of one
+    call per email - the system prompt tokens get amortized across the batch.
+    Output: list of "important" / "not important", aligned with the input.
+    """
+    labels: List[str] = []
+    for i in range(0, len(emails), BATCH_CLASSIFY_SIZE):
+        chunk = emails[i:i + BATCH_CLASSIFY_SIZE]
+        numbered = "\n\n".join(
+            f"{j + 1}. From: {email.get('from', '')}\nSubject: {email.get('subject', '')}\nContent: {email.get('snippet', '')}"
+            for j, email in enumerate(chunk)
+        )
+        async with _llm_semaphore():
+            try:
+                result = await _BATCH_CLASSIFY_CHAIN.ainvoke({"count": len(chunk), "emails": numbered})
+            except Exception as e:
+                # Same guard as classify_emails: one malformed response must
+                # not 500 the polling endpoints through afilter_important
+                print(f"Batch classification failed: {e}")
+                result = []
+
+        labels.extend(_normalize_batch_labels(result, len(chunk)))
+    return labels
+
+def _normalize_batch_labels(result, count: int) -> List[str]:
+    # Normalize and pad so one malformed response can't misalign the batch
+    if not isinstance(result, list):
+        result = []
+    return [
+        "important" if j < len(result) and str(result[j]).strip().lower() == "important" else "not important"
+        for j in range(count)
+    ]
+
+@tool("classify_emails", return_direct=False)
+def classify_emails(emails: list) -> list:
+    """
+    Classify SEVERAL emails as important / not important at once. PREFER THIS
+    over calling classify_email repeatedly when more than one email is involved.
+    Input: list of email dicts from one of the fetch emails tools.
+    Output: list of "important" / "not important", aligned with the input.
+    """
+    labels: List[str] = []
+    for i in range(0, len(emails), BATCH_CLASSIFY_SIZE):
+        chunk = emails[i:i + BATCH_CLASSIFY_SIZE]
+        numbered = "\n\n".join(
+            f"{j + 1}. From: {email.get('from', '')}\nSubject: {email.get('subject', '')}\nContent: {email.get('snippet', '')}"
+            for j, email in enumerate(chunk)
+        )
+        try:
+            result = _BATCH_CLASSIFY_CHAIN.invoke({"count": len(chunk), "emails": numbered})
+        except Exception as e:
+            print(f"Batch classification failed: {e}")
+            result = []
+        labels.extend(_normalize_batch_labels(result, len(chunk)))
+    return labels
+
+@tool("summarize_emails", return_direct=False)
+def summarize_emails(emails: list) -> list:
+    """
+    Summarize SEVERAL emails at once, one concise phrase each. PREFER THIS
+    over summarizing emails one by one.
+    Input: list of email dicts from one of the fetch emails tools.
+    Output: list of summary strings, aligned with the input.
+    """
+    texts = [
+        f"Subject: {email.get('subject', '')}\nContent: {email.get('snippet', '')}"
+        for email in emails
+    ]
+    keys = [email_fingerprint(text) for text in texts]
+    summaries = [_summary_cache.get(key) for key in keys]
+
+    # Only cache misses go to the LLM, batched to amortize the prompt tokens
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    for i in range(0, len(missing), BATCH_CLASSIFY_SIZE):
+        chunk = missing[i:i + BATCH_CLASSIFY_SIZE]
+        numbered = "\n\n".join(f"{j + 1}. {texts[idx]}" for j, idx in enumerate(chunk))
+        try:
+            result = _BATCH_SUMMARIZE_CHAIN.invoke({"count": len(chunk), "emails": numbered})
+        except Exception as e:
+            print(f"Batch summarization failed: {e}")
+            result = []
+        if not isinstance(result, list):
+            result = []
+        for j, idx in enumerate(chunk):
+            summary = str(result[j]).strip() if j < len(result) else ""
+            summaries[idx] = summary
+            if summary:
+                _cache_put(_summary_cache, keys[idx], summary)
+    return summaries
+
+async def asummarize_email(email: dict) -> str:
+    """Async version of summarize_email so all summaries can be generated concurrently."""
+    subject = email.get("subject", "")
+    snippet = email.get("snippet", "")
+    text = f"Subject: {subject}\nContent: {snippet}"
+
+    key = email_fingerprint(text)
+    if key in _summary_cache:
+        return _summary_cache[key]
+
+    async with _llm_semaphore():
+        response = await _SUMMARIZE_CHAIN.ainvoke({"email": text})
+    summary = response.content.strip()
+    _cache_put(_summary_cache, key, summary)
+    return summary
+
+async def asummarize_email_stream(email: dict):
+    """
+    Async generator that yields summary tokens as Groq produces them, so the
+    frontend can start rendering before the full generation ends.
+    Serves cached summaries in a single chunk.
+    """
+    subject = email.get("subject", "")
+    snippet = email.get("snippet", "")
+    text = f"Subject: {subject}\nContent: {snippet}"
+
+    key = email_fingerprint(text)
+    if key in _summary_cache:
+        yield _summary_cache[key]
+        return
+
+    parts = []
+    async with _llm_semaphore():
+        async for chunk in _SUMMARIZE_CHAIN.astream({"email": text}):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+    _cache_put(_summary_cache, key, "".join(parts).strip())
 
 # -------------------------------------------------------------------------------------------
 # --- Generate Todo List Tool --------------------------------------------------------------
 
+SPAM_KEYWORDS = ["unsubscribe", "newsletter", "promo", "sale", "advertisement"]
+
+# Same precompiled-alternation trick as _IMPORTANT_KW_RE. The word boundaries
+# also make the old punctuation-stripping re.sub pass unnecessary.
+_SPAM_KW_RE = re.compile(r"\b(?:" + "|".join(re.escape(kw) for kw in SPAM_KEYWORDS) + r")\b", re.IGNORECASE)
+
 def is_spam(email: Dict) -> bool:
     """
     Simple rule-based check to filter out spam emails.
     """
-    subject = email.get("subject", "").lower()
-    body = email.get("snippet", "").lower()
-    spam_keywords = ["unsubscribe", "newsletter", "promo", "sale", "advertisement"]
-
-    # Combine subject and body, lowercase everything
-    text = (subject + " " + body).lower()
-
-    # Remove punctuation for safer matching
-    text = re.sub(r"[^\w\s]", " ", text)
+    subject = email.get("subject", "")
+    body = email.get("snippet", "")
 
-    if any(keyword in text for keyword in spam_keywords):
+    if _SPAM_KW_RE.search(f"{subject} {body}"):
         print(f"Filtered out as spam: {subject}")
         return True
     return False
 
+MIN_BODY_FOR_TODO = 40 # bodies shorter than this can't describe a real task
+
+_WORD_RE = re.compile(r"[a-zA-Z]{3,}")
+_todo_cache: Dict[str, List[str]] = {}
+
 def generate_todo_for_email(email: Dict) -> List[str]:
     subject = email.get("subject", "")
     body = email.get("snippet", "")
@@ -335,6 +675,15 @@ def generate_todo_for_email(email: Dict) -> List[str]:
         return []
     print("Not spam!")
 
+    # Degenerate bodies - read receipts, bare calendar stubs - can't contain
+    # actionable tasks, so don't spend a Groq round trip on them
+    if len(body.strip()) < MIN_BODY_FOR_TODO or not _WORD_RE.search(body):
+        return []
+
+    key = email_fingerprint(text)
+    if key in _todo_cache:
+        return _todo_cache[key]
+
     if rule_based_check(subject, body, sender):
         print("important")
     elif llm_fallback_check(f"Subject: {subject}\nContent: {body}"):
@@ -350,12 +699,16 @@ def generate_todo_for_email(email: Dict) -> List[str]:
     Email:
     {text}
     """
-    response = llm.invoke(prompt)
-
-    if response.content.strip().lower() in ["", "none", "no tasks", "no task", "no action", "empty string"]:
-        return []
+    content = cached_invoke(prompt).strip()
 
-    return response.content.strip().split("\n")
+    if content.lower() in ["", "none", "no tasks", "no task", "no action", "empty string"]:
+        todos = []
+    else:
+        # dict.fromkeys dedupes repeated task lines in one pass while keeping
+        # the model's ordering (sets would shuffle it)
+        todos = list(dict.fromkeys(line for line in content.split("\n") if line.strip()))
+    _cache_put(_todo_cache, key, todos)
+    return todos
 
 @tool("generate_todo", return_direct=False)
 def generate_todo(emails: dict | list) -> list:
@@ -378,6 +731,78 @@ def generate_todo(emails: dict | list) -> list:
 # -------------------------------------------------------------------------------------------
 # --- Sort Emails Tool ----------------------------------------------------------------------
 
+EMAIL_CATEGORIES = ['trash', 'spam', 'CATEGORY_PROMOTIONS', 'CATEGORY_SOCIAL', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS', 'inbox']
+
+_BATCH_CATEGORY_CHAIN = ChatPromptTemplate.from_messages([
+    ("system", "You are an assistant that classifies emails into categories - 'trash', 'spam', 'CATEGORY_PROMOTIONS', 'CATEGORY_SOCIAL', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS', "
+               "and if nothing applies, 'inbox'. News (eg: from the New York Times) come under updates. General informational emails come under forums. "
+               "You will receive a numbered list of emails. Respond ONLY with a JSON array of category strings, one per email, in the same order."),
+    ("user", "{emails}")
+]) | llm_fast | JsonOutputParser()
+
+BATCH_MODIFY_LIMIT = 1000 # Gmail's cap on ids per batchModify call
+
+def batch_move_emails(service, ids_by_category: Dict[str, List[str]]) -> None:
+    """
+    Execute all pending moves in a handful of HTTP round trips. trash/spam
+    have no bulk endpoint, but their individual calls ride Gmail's batch HTTP
+    endpoint (100 per request); label moves use batchModify natively.
+    """
+    def report(request_id, response, exception):
+        if exception is not None:
+            print(f"Failed to move message {request_id}: {exception}")
+
+    trash_spam = [
+        (mid, action)
+        for action in ("trash", "spam")
+        for mid in ids_by_category.get(action, [])
+    ]
+    for i in range(0, len(trash_spam), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=report)
+        for mid, action in trash_spam[i:i + BATCH_SIZE]:
+            request = getattr(service.users().messages(), action)(userId='me', id=mid)
+            batch.add(request, request_id=mid)
+        batch.execute()
+
+    for category, ids in ids_by_category.items():
+        if category in ("trash", "spam", "inbox") or not ids:
+            continue
+        for i in range(0, len(ids), BATCH_MODIFY_LIMIT):
+            service.users().messages().batchModify(
+                userId='me',
+                body={
+                    'ids': ids[i:i + BATCH_MODIFY_LIMIT],
+                    'addLabelIds': [category],
+                    'removeLabelIds': ['INBOX'],
+                },
+            ).execute()
+        print(f"Moved {len(ids)} message(s) to {category}.")
+
+def classify_categories_batch(emails: List[dict]) -> List[str]:
+    """
+    Categorize several emails per LLM call for the automated sorter, instead
+    of one prompt per email. Malformed or off-enum responses fall back to
+    'inbox' - the safe default, since those emails are simply left in place.
+    """
+    categories = []
+    for i in range(0, len(emails), BATCH_CLASSIFY_SIZE):
+        chunk = emails[i:i + BATCH_CLASSIFY_SIZE]
+        numbered = "\n\n".join(
+            f"{j + 1}. Subject: {e.get('subject', '')}\nContent: {e.get('snippet', '')}"
+            for j, e in enumerate(chunk)
+        )
+        try:
+            result = _BATCH_CATEGORY_CHAIN.invoke({"emails": numbered})
+        except Exception as e:
+            print(f"Batch categorization failed, leaving chunk in inbox: {e}")
+            result = []
+        if not isinstance(result, list):
+            result = []
+        result = [c if isinstance(c, str) and c in EMAIL_CATEGORIES else "inbox" for c in result]
+        result += ["inbox"] * (len(chunk) - len(result)) # pad short responses
+        categories.extend(result[:len(chunk)])
+    return categories
+
 @tool("sort_and_move_emails", return_direct=False)
 def sort_and_move_emails(query: str = "", **kwargs) -> str:
     """
@@ -398,48 +823,52 @@ def sort_and_move_emails(query: str = "", **kwargs) -> str:
 
     # Sort emails into categories if it's automated sorting
     if query == "":
-        for email in unread_emails:
+        service = get_gmail_service()
+
+        # Phase 1: classify everything up front. The importance pass mirrors
+        # classify_email's cheap checks (rules, spam keywords) per email, but
+        # the rule-miss residual goes through the batched classify chain - one
+        # LLM call per 20 emails instead of a Groq round trip per email.
+        categories = [None] * len(unread_emails)
+        residual, residual_slots = [], []
+        for idx, email in enumerate(unread_emails):
             subject = email.get("subject", "")
-            snippet = email.get("snippet", "")
-            message_id = email.get("id", "")
-            text = f"Subject: {subject}\nContent: {snippet}"
-
-            if classify_email.func(email) == "important":
-                category = "inbox"
+            sender = email.get("from", "")
+            if rule_based_check(subject, "", sender):
+                categories[idx] = "inbox"
+                print(f"Classified as important (inbox) - {subject}")
+            elif _SPAM_KW_RE.search(subject) or is_spam(email):
+                categories[idx] = "not important" # resolved below by the category pass
+            elif rule_based_check(subject, email.get("snippet", ""), sender):
+                categories[idx] = "inbox"
                 print(f"Classified as important (inbox) - {subject}")
             else:
-                # ask LLM
-                prompt = f"""
-                You are an assistant that classifies emails into categories - 'trash', 'spam', 'CATEGORY_PROMOTIONS', 'CATEGORY_SOCIAL', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS', 
-                and if nothing applies, 'inbox'. News (eg: from the New York Times) come under updates. General informational emails come under forums.
-                Choose an apt classification for this email: "{text}"
-                Reply with only one word and no other context - trash, spam, CATEGORY_PROMOTIONS, CATEGORY_SOCIAL, CATEGORY_UPDATES, CATEGORY_FORUMS, inbox.
-                """
-                response = llm.invoke(prompt)
-                category = response.content.strip()
-
-                print(f"Classified as {category} - {subject}")
-            
-
-            # Move email to the appropriate category
-            service = get_gmail_service()
-            if category == "spam":
-                service.users().messages().spam(userId='me', id=message_id).execute()
-                print(f"Message with subject {subject} successfully reported as Spam.")
-            elif category == "trash":
-                service.users().messages().trash(userId='me', id=message_id).execute()
-                print(f"Message with subject {subject} successfully moved to Trash.")
-            else: #categories
-                categories = ['CATEGORY_PROMOTIONS', 'CATEGORY_SOCIAL', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS']
-                if category in categories:
-                    service.users().messages().modify(
-                        userId='me',
-                        id=message_id,
-                        body={'addLabelIds': [category], 'removeLabelIds': ['INBOX']}
-                    ).execute()
-                    print(f"Message with subject {subject} successfully moved to {category}.")
-                else:
-                    print(f"Message with subject {subject} left in Inbox.")
+                residual.append(email)
+                residual_slots.append(idx)
+        for idx, label in zip(residual_slots, classify_emails.func(residual)):
+            if label == "important":
+                categories[idx] = "inbox"
+                print(f"Classified as important (inbox) - {unread_emails[idx].get('subject', '')}")
+            else:
+                categories[idx] = "not important"
+        to_categorize, slots = [], []
+        for idx, category in enumerate(categories):
+            if category == "not important":
+                to_categorize.append(unread_emails[idx])
+                slots.append(idx)
+        for idx, category in zip(slots, classify_categories_batch(to_categorize)):
+            categories[idx] = category
+            print(f"Classified as {category} - {unread_emails[idx].get('subject', '')}")
+
+        # Phase 2: group ids by destination and move them in batched requests
+        # instead of one Gmail round trip per email
+        ids_by_category: Dict[str, List[str]] = {}
+        for email, category in zip(unread_emails, categories):
+            if category == "inbox" or category not in EMAIL_CATEGORIES:
+                print(f"Message with subject {email.get('subject', '')} left in Inbox.")
+                continue
+            ids_by_category.setdefault(category, []).append(email.get("id", ""))
+        batch_move_emails(service, ids_by_category)
 
         return "Sorting complete!"
     else:
@@ -451,20 +880,14 @@ def sort_and_move_emails(query: str = "", **kwargs) -> str:
         If the user query does not clearly indicate either, reply with 'none'.
         User query: "{user_query}"
         """
-        response = llm.invoke(prompt)
-        action = response.content.strip().lower()
+        # Exact-match caching only: this prompt routes a destructive move, and
+        # a merely-similar query must not inherit another query's trash/spam
+        # verdict
+        action = cached_invoke(prompt, semantic=False).strip().lower()
         print(f"Action determined from query - {query}: {action}")
         if action not in ["trash", "spam"]:
             return "Beyond the scope of this tool. No action taken."
-        for email in unread_emails:
-            subject = email.get("subject", "")
-            message_id = email.get("id", "")
-
-            # Move email to the appropriate category
-            service = get_gmail_service()
-            if action == "spam":
-                service.users().messages().spam(userId='me', id=message_id).execute()
-                print(f"Message with subject {subject} successfully reported as Spam.")
-            elif action == "trash":
-                service.users().messages().trash(userId='me', id=message_id).execute()
-                print(f"Message with subject {subject} successfully moved to Trash.")
+        service = get_gmail_service()
+        # All emails share one destination here - send the moves as batched requests
+        batch_move_emails(service, {action: [email.get("id", "") for email in unread_emails]})
+        print(f"Moved {len(unread_emails)} message(s) to {action}.")
@@ -7,6 +7,8 @@ load_dotenv()  # read .env
 #GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 #GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 GMAIL_TOKEN_PATH = os.getenv("GMAIL_TOKEN_PATH", "token.json")
+SENDER_ALLOWLIST_PATH = os.getenv("SENDER_ALLOWLIST_PATH", "important_senders.json")
+GMAIL_STATE_PATH = os.getenv("GMAIL_STATE_PATH", "gmail_state.json")
 
 # Groq
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -1,10 +1,21 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# orjson serializes the notification/todo payloads several times faster than
+# the stdlib encoder; fall back to the default JSONResponse when not installed
+try:
+    import orjson  # noqa: F401 - only checking availability for ORJSONResponse
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    DefaultResponse = JSONResponse
 
-from agents.pipelines import get_notifications, sort, get_todolist
-from agents.chat_agent import run_chat
+from agents.pipelines import get_notifications, astream_notifications, asort, get_todolist
+from agents.chat_agent import arun_chat, arun_chat_stream
 
-app = FastAPI(title="WaveMail - Backend API")
+app = FastAPI(title="WaveMail - Backend API", default_response_class=DefaultResponse)
 
 # CORS
 app.add_middleware(
@@ -17,21 +28,44 @@ app.add_middleware(
 
 # ---------------- Notifications / Todo ----------------
 @app.get("/notifications")
-def notifications():
-    return {"notifications": get_notifications()}
+async def notifications(n: int | None = None):
+    # The pipeline blocks on Gmail I/O (and runs its own event loop for the
+    # LLM calls), so it goes to a worker thread to keep this loop serving.
+    # n caps how many emails the pipeline considers (the dashboard asks for 4).
+    return {"notifications": await asyncio.to_thread(get_notifications, "is:important", n)}
+
+@app.get("/notifications/stream")
+def notifications_stream():
+    # Streams summaries token by token as server-sent events
+    return StreamingResponse(astream_notifications(), media_type="text/event-stream")
 
 @app.get("/todolist")
-def todo():
-    return {"todolist": get_todolist()}
+async def todo(n: int | None = None):
+    return {"todolist": await asyncio.to_thread(get_todolist, "is:important", n)}
+
+@app.get("/dashboard")
+async def dashboard():
+    # First paint hits both tiles; run the two pipelines concurrently instead
+    # of letting the frontend serialize two round trips
+    notifications, todolist = await asyncio.gather(
+        asyncio.to_thread(get_notifications),
+        asyncio.to_thread(get_todolist),
+    )
+    return {"notifications": notifications, "todolist": todolist}
 
 # ---------------- Chat Agent ----------------
 @app.get("/chat")
-def chat(query: str):
-    response = run_chat(query)
+async def chat(query: str):
+    response = await arun_chat(query)
     return {"response": response}
 
+@app.get("/chat/stream")
+def chat_stream(query: str):
+    # Streams the agent's answer token by token as server-sent events
+    return StreamingResponse(arun_chat_stream(query), media_type="text/event-stream")
+
 # ---------------- Automated Sorting ----------------
 @app.get("/automatedsort")
-def automatedsort():
-    response = sort()
+async def automatedsort():
+    response = await asort()
     return {"response": response}
@@ -1,11 +1,43 @@
+import functools
+import threading
+
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 from config import GMAIL_TOKEN_PATH
 
-def get_gmail_service():
-    creds = Credentials.from_authorized_user_file(
+# Generation counter lets reset_gmail_service invalidate every thread's
+# cached client without reaching into other threads' locals.
+_local = threading.local()
+_generation = 0
+
+@functools.lru_cache(maxsize=1)
+def _load_credentials():
+    return Credentials.from_authorized_user_file(
         GMAIL_TOKEN_PATH,
         ["https://www.googleapis.com/auth/gmail.modify"]
     )
-    return build("gmail", "v1", credentials=creds)
 
+def get_gmail_service():
+    """
+    Build the Gmail client once per thread and reuse it across tool calls.
+    Credentials are parsed from the token file a single time (they are
+    thread-safe), but each thread needs its own service object: the
+    underlying httplib2.Http transport is not, and the batch fallback pool,
+    the pipelined page fetch, /dashboard's concurrent pipelines and the chat
+    agent's tool fan-out all call Gmail from worker threads.
+    static_discovery also skips the discovery-document HTTP fetch entirely.
+    """
+    if getattr(_local, "generation", None) == _generation:
+        return _local.service
+    _local.service = build(
+        "gmail", "v1", credentials=_load_credentials(),
+        cache_discovery=False, static_discovery=True
+    )
+    _local.generation = _generation
+    return _local.service
+
+def reset_gmail_service():
+    """Drop all cached clients so the next call rebuilds (e.g. after a 401)."""
+    global _generation
+    _load_credentials.cache_clear()
+    _generation += 1
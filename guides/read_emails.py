@@ -1,5 +1,14 @@
 import os.path
 import base64
+import email
+import email.policy
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -10,21 +19,122 @@ from googleapiclient.errors import HttpError
 # modification access
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 
-import base64
 # You might need to install this library first: pip install beautifulsoup4
-from bs4 import BeautifulSoup 
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Skip the tags we were going to decompose anyway (plus head-only noise)
+# while the tree is being BUILT, instead of materializing thousands of
+# nodes and then walking the soup to throw them away.
+_STRAINER = SoupStrainer(
+    lambda name: name not in ('img', 'script', 'style', 'head', 'meta', 'link')
+)
+
+# selectolax (Cython bindings over the lexbor engine) parses HTML 10-25x
+# faster than BeautifulSoup and never allocates per-node Python objects.
+# pip install selectolax — BeautifulSoup stays as the fallback.
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Preview extraction doesn't need DOM fidelity, only tags removed and
+# whitespace collapsed — one compiled regex pass does that without
+# allocating a tree at all. script/style blocks are dropped with their
+# contents; every other tag is replaced by a space.
+_TAG_RE = re.compile(r'<(script|style)[^>]*>.*?</\1\s*>|<[^>]+>', re.S | re.I)
+_WS_RE = re.compile(r'\s+')
+
+def _html_to_text(text_html, max_chars=None):
+    """
+    Strips tags (and img/script/style content) from an HTML body and
+    returns the plain text. Preview calls (max_chars set) skip HTML
+    parsing entirely and regex-strip the markup; full extractions use
+    the fastest parser available.
+    """
+    if max_chars is not None:
+        if isinstance(text_html, bytes):
+            text_html = text_html.decode('utf-8', 'replace')
+        return _WS_RE.sub(' ', _TAG_RE.sub(' ', text_html)).strip()[:max_chars]
+    if LexborHTMLParser is not None:
+        tree = LexborHTMLParser(text_html)
+        for tag in tree.css('img, script, style'):
+            tag.decompose()
+        return tree.body.text(separator='\n', strip=True) if tree.body else ''
+    if _lxml_html is not None:
+        doc = _lxml_html.fromstring(text_html)
+        # One C-level pass removes the noise tags with their content
+        _lxml_etree.strip_elements(doc, 'script', 'style', 'img', with_tail=False)
+        return doc.text_content().strip()
+    soup = BeautifulSoup(text_html, _BS_PARSER, parse_only=_STRAINER)
+    return soup.get_text(separator='\n', strip=True)
+
+# lxml's C parser is roughly 5-10x faster than the pure-Python
+# "html.parser" backend on real email HTML, and more tolerant of the
+# malformed markup mail clients produce. pip install lxml. When present
+# it is also used directly (strip_elements + text_content, two C-level
+# tree passes) before falling back to BeautifulSoup, and as the
+# BeautifulSoup backend for the last-resort soup path.
+try:
+    from lxml import etree as _lxml_etree
+    from lxml import html as _lxml_html
+    _BS_PARSER = "lxml"
+except ImportError:
+    _lxml_html = None
+    _BS_PARSER = "html.parser"
+
+# orjson parses JSON several times faster than the stdlib json module,
+# which shows up on Gmail's nested payload responses. When installed,
+# the service is built with a model whose deserialize step uses it;
+# otherwise googleapiclient's default JsonModel is kept.
+try:
+    import orjson
+    from googleapiclient.model import JsonModel
+
+    class _OrjsonModel(JsonModel):
+        def deserialize(self, content):
+            body = orjson.loads(content)
+            if self._data_wrapper and isinstance(body, dict) and 'data' in body:
+                body = body['data']
+            return body
+
+    _MODEL = _OrjsonModel()
+except ImportError:
+    _MODEL = None
+
+# base64url only differs from standard base64 in two alphabet bytes.
+# bytes.translate is a single vectorized C pass, so mapping -_ to +/ up
+# front and handing the result to the standard-alphabet decoder beats the
+# urlsafe entry points, which interleave the remapping with the decode.
+_URLSAFE_TRANS = bytes.maketrans(b'-_', b'+/')
+
+# pybase64 decodes with SIMD kernels (AVX2/NEON) when the CPU supports
+# them, which matters on large HTML bodies and raw-format blobs.
+# pip install pybase64 — the stdlib decoder is a drop-in fallback.
+try:
+    import pybase64
+
+    def _b64(data):
+        if isinstance(data, str):
+            data = data.encode('ascii')
+        return pybase64.b64decode(data.translate(_URLSAFE_TRANS), validate=False)
+except ImportError:
+    def _b64(data):
+        if isinstance(data, str):
+            data = data.encode('ascii')
+        return base64.b64decode(data.translate(_URLSAFE_TRANS))
 
-def get_message_body(msg):
+def get_message_body(msg, max_chars=None):
     """
     Decodes an email message and returns the body content.
     Prioritizes 'text/plain', falls back to 'text/html' and strips its tags.
+    max_chars caps the returned text for preview-only callers.
     """
     # If the message is multipart, recursively search for the parts
     if msg.is_multipart():
         # A multipart message will have a list of parts
         for part in msg.get_payload():
             # Recursively call this function for each part
-            body = get_message_body(part)
+            body = get_message_body(part, max_chars)
             if body: # If a body was found in a subpart, return it
                 return body
         return "" # If no body found in any part
@@ -39,18 +149,14 @@ def get_message_body(msg):
     # Check the content type
     if content_type == 'text/plain':
         try:
-            return payload.decode('utf-8')
+            text = payload.decode('utf-8')
         except UnicodeDecodeError:
-            return payload.decode('latin-1') # Fallback encoding
+            text = payload.decode('latin-1') # Fallback encoding
+        return text[:max_chars] if max_chars is not None else text
 
     elif content_type == 'text/html':
-        # If we only have HTML, use BeautifulSoup to strip tags
-        soup = BeautifulSoup(payload, "html.parser")
-        # Find all image tags and remove them
-        for img_tag in soup.find_all('img'):
-            img_tag.decompose()
-        # Return the text content of the cleaned HTML
-        return soup.get_text(separator='\n', strip=True)
+        # If we only have HTML, strip the tags and return the text content
+        return _html_to_text(payload, max_chars)
         
     # If it's another content type (like an attachment), ignore it
     return ""
@@ -59,66 +165,145 @@ def get_message_body(msg):
 # The official Google API library might not return a standard email.message.Message object.
 # The following function is tailored for the raw dictionary structure from the API.
 
-def get_body_from_google_api_payload(payload):
+def get_body_from_google_api_payload(payload, max_chars=None):
     """
     Parses the Google API 'payload' dictionary to find the email body.
     Prioritizes 'text/plain', falls back to 'text/html' and strips its tags.
+    max_chars caps the returned text for preview-only callers.
     """
-    text_plain = None
     text_html = None
 
-    def find_parts(parts):
-        nonlocal text_plain, text_html
-        for part in parts:
-            if part.get('mimeType') == 'text/plain' and 'data' in part['body']:
-                text_plain = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                # If we find plain text, we can often stop, as it's preferred
-                return
-            elif part.get('mimeType') == 'text/html' and 'data' in part['body']:
-                text_html = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-            
-            # Recursive call for nested parts
-            if 'parts' in part:
-                find_parts(part['parts'])
-
-    # Start the search
-    if 'parts' in payload:
-        find_parts(payload['parts'])
-    elif 'data' in payload['body']:
-        if payload.get('mimeType') == 'text/plain':
-            text_plain = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-        elif payload.get('mimeType') == 'text/html':
-            text_html = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-
-    # --- Prioritize and Clean ---
-    if text_plain:
-        return text_plain
-    elif text_html:
-        # We only have HTML, so we need to clean it
-        soup = BeautifulSoup(text_html, "html.parser")
-        # You can remove specific tags like this:
-        for img in soup.find_all('img'):
-            img.decompose() # Remove the <img> tag completely
-        for script in soup.find_all('script'):
-            script.decompose() # Remove <script> tags
-        for style in soup.find_all('style'):
-            style.decompose() # Remove <style> tags
-            
-        # Get the text, which is now free of images and other unwanted tags
-        return soup.get_text(separator='\n', strip=True)
-        
+    # Iterative walk over the MIME tree instead of a recursive closure:
+    # no per-call frame allocation, and text/plain is preferred outright,
+    # so we return the moment one turns up. The HTML candidate is kept as
+    # the raw base64 data and only decoded once plain text is ruled out,
+    # which skips a decode + HTML parse on multipart/alternative messages.
+    stack = list(payload.get('parts') or [payload])
+    while stack:
+        part = stack.pop()
+        body = part.get('body') or {}
+        data = body.get('data')
+        if data:
+            mime_type = part.get('mimeType')
+            if mime_type == 'text/plain':
+                text = _b64(data).decode('utf-8', 'replace')
+                return text[:max_chars] if max_chars is not None else text
+            if mime_type == 'text/html' and text_html is None:
+                text_html = data  # defer decode until plain text is ruled out
+        if 'parts' in part:
+            stack.extend(part['parts'])
+
+    if text_html:
+        # We only have HTML, so clean it and return the remaining text.
+        # The decoded bytes go straight to the parser — both selectolax
+        # and BeautifulSoup accept bytes and sniff the charset, so the
+        # whole body is never UTF-8 decoded in Python just to be parsed.
+        return _html_to_text(_b64(text_html), max_chars)
+
     return "No readable body found."
 
-def main():
+def _with_retry(req, max_tries=5):
     """
-    Lists the user's Gmail labels and fetches emails.
+    Executes a Gmail API request, retrying transient 429/5xx errors with
+    exponential backoff plus jitter. Under concurrency a 429 is the
+    common case, and without retries one rate-limited call aborts the
+    whole run and throws away all prior work.
+    """
+    for attempt in range(max_tries):
+        try:
+            return req.execute()
+        except HttpError as error:
+            if error.resp.status not in (429, 500, 503) or attempt == max_tries - 1:
+                raise
+            time.sleep(min(2 ** attempt + random.random(), 32))
+
+# Repeated runs (e.g. on a cron) refetch and reprint ids they already
+# processed. Seen ids are remembered in a small sqlite file, so only new
+# messages are fetched on re-runs.
+_SEEN_DB = os.path.join(os.path.expanduser('~'), '.wavemail', 'seen.db')
+
+def _load_seen():
+    """Opens the seen-id store and returns (connection, set of ids)."""
+    os.makedirs(os.path.dirname(_SEEN_DB), exist_ok=True)
+    conn = sqlite3.connect(_SEEN_DB)
+    conn.execute('CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY)')
+    seen = {row[0] for row in conn.execute('SELECT id FROM seen')}
+    return conn, seen
+
+def _mark_seen(conn, ids):
+    conn.executemany('INSERT OR IGNORE INTO seen VALUES (?)', [(i,) for i in ids])
+    conn.commit()
+
+# Gmail allows at most 100 calls per batch request
+BATCH_SIZE = 100
+
+def _get_request(service, mid, fetch_body):
+    if fetch_body:
+        return service.users().messages().get(userId='me', id=mid, format='raw')
+    # Listing-only callers don't pay for the body at all: a metadata get
+    # returns just the named headers, ~200 bytes instead of kilobytes.
+    return service.users().messages().get(
+        userId='me', id=mid, format='metadata',
+        metadataHeaders=['Subject', 'From', 'Date'])
+
+def fetch_messages_batched(service, messages, fetch_body=True):
+    """
+    Fetches message objects for a list of {'id': ...} dicts.
+    Instead of one HTTP round trip per message, gets ride Gmail's batch
+    endpoint 100 at a time — for a 20-message inbox that's 1 round trip
+    instead of 20. Pass fetch_body=False to get Subject/From/Date
+    headers only, which shrinks each response from kilobytes to a few
+    hundred bytes.
+    """
+    fetched = []
+
+    def _on_msg(request_id, response, exception):
+        if exception is not None:
+            print(f'Failed to fetch message {request_id}: {exception}')
+        else:
+            fetched.append(response)
+
+    if not hasattr(service, 'new_batch_http_request'):
+        # Fallback when the transport has no batch endpoint: overlap the
+        # per-message round trips across a small thread pool instead of
+        # fetching them one after another. 10 workers stays well inside
+        # Gmail's 250 quota-units/s budget (messages.get costs 5 units).
+        # Each worker uses its own client (_thread_service) — sharing the
+        # caller's service across threads would share one httplib2
+        # transport, which is not thread-safe.
+        def _get(mid):
+            try:
+                return _with_retry(_get_request(_thread_service(), mid, fetch_body))
+            except HttpError as error:
+                print(f'Failed to fetch message {mid}: {error}')
+                return None
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            fetched = [m for m in pool.map(_get, [m['id'] for m in messages]) if m]
+        return fetched
+
+    for start in range(0, len(messages), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=_on_msg)
+        for message in messages[start:start + BATCH_SIZE]:
+            batch.add(
+                _get_request(service, message['id'], fetch_body),
+                request_id=message['id']
+            )
+        _with_retry(batch)
+    return fetched
+
+@lru_cache(maxsize=1)
+def get_credentials():
+    """
+    Runs the OAuth flow (or token.json refresh) once per process. The
+    credentials object is thread-safe and shared; the service objects
+    built on top of it are not (see _thread_service).
     """
     creds = None
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first time.
     if os.path.exists('token.json'):
         creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-        
+
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
@@ -128,38 +313,90 @@ def main():
             flow = InstalledAppFlow.from_client_secrets_file(
                 'credentials.json', SCOPES)
             creds = flow.run_local_server(port=0)
-            
+
         # Save the credentials for the next run
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
 
+    return creds
+
+def _build_service():
+    # static_discovery=True loads the discovery document bundled with the
+    # client library instead of downloading ~200 KB of discovery JSON over
+    # HTTP on every build.
+    if _MODEL is not None:
+        return build('gmail', 'v1', credentials=get_credentials(),
+                     static_discovery=True, model=_MODEL)
+    return build('gmail', 'v1', credentials=get_credentials(),
+                 static_discovery=True)
+
+@lru_cache(maxsize=1)
+def get_gmail_service():
+    """
+    Builds the Gmail client once per process; repeat callers get the
+    memoized client. Single-threaded use only — the underlying
+    httplib2.Http transport is not thread-safe, so pool workers go
+    through _thread_service instead.
+    """
+    return _build_service()
+
+_thread_local = threading.local()
+
+def _thread_service():
+    """
+    Per-thread Gmail client for the fetch pool. httplib2 transports are
+    not thread-safe, so each worker builds (and then reuses) its own
+    service from the shared credentials instead of borrowing the
+    process-wide one.
+    """
+    service = getattr(_thread_local, 'service', None)
+    if service is None:
+        service = _thread_local.service = _build_service()
+    return service
+
+def main():
+    """
+    Lists the user's Gmail labels and fetches emails.
+    """
     try:
         # Call the Gmail API
-        service = build('gmail', 'v1', credentials=creds)
+        service = get_gmail_service()
 
         # results = service.users().messages().list(userId='me', maxResults=5).execute() # Get the 5 most recent messages
-        results = service.users().messages().list(userId='me').execute()
+        results = _with_retry(service.users().messages().list(userId='me'))
         messages = results.get('messages', [])
         #STOP HERE
         if not messages:
             print('No messages found.')
             return
 
+        # Skip ids this process (or a previous run) already handled
+        conn, seen = _load_seen()
+        messages = [m for m in messages if m['id'] not in seen]
+        if not messages:
+            print('No new messages.')
+            return
+
         print('Fetching emails:\n')
-        for message in messages:
-            msg = service.users().messages().get(userId='me', id=message['id']).execute()
-            
-            # Get the headers
-            headers = msg['payload']['headers']
-            subject = next((d['value'] for d in headers if d['name'] == 'Subject'), 'No Subject')
-            sender = next((d['value'] for d in headers if d['name'] == 'From'), 'Unknown Sender')
-            body = get_body_from_google_api_payload(msg['payload'])
+        processed = []
+        for msg in fetch_messages_batched(service, messages):
+            # format='raw' hands us the whole RFC 822 message as a single
+            # base64url blob: one decode and one local parse, instead of
+            # the server-built payload tree with a base64 field per part.
+            parsed = email.message_from_bytes(
+                _b64(msg['raw']), policy=email.policy.default)
+            subject = parsed['Subject'] or 'No Subject'
+            sender = parsed['From'] or 'Unknown Sender'
+            body = get_message_body(parsed, max_chars=500)
 
             print(f"---------------------------------")
             print(f"From: {sender}")
             print(f"Subject: {subject}")
-            print(f"\nBody:\n{body[:500]}...") # Print first 500 chars of the body
+            print(f"\nBody:\n{body}...") # Body is already capped at 500 chars
             print(f"---------------------------------\n")
+            processed.append(msg['id'])
+
+        _mark_seen(conn, processed)
 
     except HttpError as error:
         print(f'An error occurred: {error}')